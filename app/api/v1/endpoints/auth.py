@@ -1,118 +1,325 @@
+from dataclasses import dataclass
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 from jose import JWTError, jwt
-import os
-from dotenv import load_dotenv
-from sqlalchemy import or_
+from sqlalchemy import or_, select
+from sqlalchemy.exc import IntegrityError
 import logging
 from typing import Optional
-import requests
+import hashlib
+import re
+import time
+import httpx
+from cachetools import TTLCache
 
+from app.core.cache import cache_get, cache_set, cache_delete
+from app.core.config import settings
 from app.core.security import verify_password, get_password_hash, create_access_token
 from app.db.session import get_db
 from app.models.user import User
-from app.schemas.user import UserCreate, UserResponse, Token, TokenData, GoogleAuthRequest, OAuthUserCreate, UserUpdate, PasswordChange
+from app.schemas.user import UserCreate, UserResponse, Token, TokenData, GoogleAuthRequest, NextAuthGooglePayload, OAuthUserCreate, UserUpdate, PasswordChange
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
 router = APIRouter()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{os.getenv('API_V1_STR', '/api/v1')}/auth/token")
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/token")
+ACCESS_TOKEN_EXPIRES = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+
+# Validated tokens, keyed by the SHA-256 digest of the token so raw tokens are
+# never kept in memory. Values are (AuthPrincipal, exp) so an entry is never served
+# past the token's own expiry, even if the cache TTL has not elapsed yet.
+TOKEN_CACHE_TTL_SECONDS = 60
+_token_cache = TTLCache(maxsize=10_000, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+# Shared client so calls to Google reuse pooled keep-alive connections; closed in the app lifespan
+google_client = httpx.AsyncClient(
+    http2=True,
+    timeout=5.0,
+    limits=httpx.Limits(max_keepalive_connections=20)
+)
+
+# Google ID tokens are verified locally against Google's published signing keys
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+_google_jwks_cache = TTLCache(maxsize=1, ttl=3600)
+# Marks a recent fetch, so tokens with unknown kids can force at most one refetch a minute
+GOOGLE_JWKS_MIN_REFRESH_SECONDS = 60
+_google_jwks_recent_fetch = TTLCache(maxsize=1, ttl=GOOGLE_JWKS_MIN_REFRESH_SECONDS)
+
+async def get_google_jwks(force_refresh: bool = False) -> dict:
+    """Return Google's signing keys by kid, fetching them at most once an hour.
+
+    force_refresh is ignored if the keys were fetched within the last minute.
+    """
+    jwks = _google_jwks_cache.get("keys")
+    if force_refresh and "fetched" not in _google_jwks_recent_fetch:
+        jwks = None
+    if jwks is None:
+        _google_jwks_recent_fetch["fetched"] = True
+        response = await google_client.get(GOOGLE_CERTS_URL)
+        response.raise_for_status()
+        jwks = {key["kid"]: key for key in response.json()["keys"]}
+        _google_jwks_cache["keys"] = jwks
+    return jwks
+
+async def verify_google_id_token(token: str) -> dict:
+    """Verify a Google ID token's signature and claims and return the claims."""
+    if not settings.GOOGLE_CLIENT_ID:
+        # Without an audience to check, a token issued to any Google client would be accepted
+        raise RuntimeError("GOOGLE_CLIENT_ID is not configured; cannot verify Google ID tokens")
+    kid = jwt.get_unverified_header(token).get("kid")
+    jwks = await get_google_jwks()
+    if kid not in jwks:
+        # Google may have rotated its keys since they were cached
+        jwks = await get_google_jwks(force_refresh=True)
+    if kid not in jwks:
+        raise JWTError("Unknown Google signing key")
+    return jwt.decode(
+        token,
+        jwks[kid],
+        algorithms=["RS256"],
+        audience=settings.GOOGLE_CLIENT_ID,
+        issuer=GOOGLE_ISSUERS,
+        # at_hash binds the ID token to an access token we never receive here
+        options={"verify_at_hash": False}
+    )
+
+# User rows shared across workers through Redis. hashed_password is left out on
+# purpose; change_password loads it from the database when needed.
+USER_CACHE_TTL_SECONDS = 300
+USER_CACHE_FIELDS = (
+    "id", "email", "username", "is_active", "preferred_theme",
+    "preferred_font", "google_id", "profile_picture"
+)
+
+def user_cache_key(user_id: int) -> str:
+    return f"user:id:{user_id}"
+
+async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[User]:
+    """Load a user by id from the shared cache, falling back to the database."""
+    data = await cache_get(user_cache_key(user_id))
+    if data is not None:
+        # Attach the cached row to the session without a SELECT so handlers can still update it
+        user = User(**data)
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+
+    user = await db.get(User, user_id)
+    if user is not None:
+        await cache_set(
+            user_cache_key(user_id),
+            {field: getattr(user, field) for field in USER_CACHE_FIELDS},
+            USER_CACHE_TTL_SECONDS
+        )
+    return user
+
+async def invalidate_cached_user(user: User) -> None:
+    await cache_delete(user_cache_key(user.id))
+
+@dataclass(frozen=True, slots=True)
+class AuthPrincipal:
+    """The authenticated user, detached from any session.
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    Most handlers only need the id and username; those that read or update
+    other user fields depend on get_current_db_user instead.
+    """
+    id: int
+    username: str
+    google_id: Optional[str]
+
+async def get_auth_principal(db: AsyncSession, user_id: int) -> Optional[AuthPrincipal]:
+    """Load the principal for a user id from the shared cache or just the needed columns."""
+    data = await cache_get(user_cache_key(user_id))
+    if data is not None:
+        return AuthPrincipal(id=data["id"], username=data["username"], google_id=data["google_id"])
+
+    result = await db.execute(
+        select(User.id, User.username, User.google_id).where(User.id == user_id)
+    )
+    row = result.first()
+    if row is None:
+        return None
+    return AuthPrincipal(id=row.id, username=row.username, google_id=row.google_id)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> AuthPrincipal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    key = hashlib.sha256(token.encode()).digest()
+    cached = _token_cache.get(key)
+    if cached is not None:
+        principal, exp = cached
+        if exp > time.time():
+            return principal
+        _token_cache.pop(key, None)
+
     try:
-        payload = jwt.decode(token, os.getenv("SECRET_KEY"), algorithms=[os.getenv("ALGORITHM", "HS256")])
-        username: str = payload.get("sub")
-        if username is None:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        user_id: str = payload.get("sub")
+        username: str = payload.get("username")
+        if user_id is None or username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
+        token_data = TokenData(user_id=user_id, username=username)
+    except (JWTError, ValueError):
         raise credentials_exception
-    user = db.query(User).filter(User.username == token_data.username).first()
-    if user is None:
+    # Primary-key lookup; the username check rejects tokens whose sub is not a user id
+    principal = await get_auth_principal(db, token_data.user_id)
+    if principal is None or principal.username != token_data.username:
         raise credentials_exception
+
+    # Only tokens carrying an expiry are cached; the TTL is implicitly capped at
+    # min(exp - now, TOKEN_CACHE_TTL_SECONDS) by the check on the read path.
+    exp = payload.get("exp")
+    if exp is not None:
+        _token_cache[key] = (principal, exp)
+    return principal
+
+async def get_current_db_user(
+    current_user: AuthPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """Load the full User row of the authenticated user, attached to the request session."""
+    user = await get_user_by_id(db, current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
 
+async def generate_unique_username(db: AsyncSession, base_username: str) -> str:
+    """Return base_username, or base_username suffixed with the lowest free counter."""
+    # Fetch every taken candidate (base or base + digits) in one query instead of probing
+    # one by one. The prefix match can use ix_users_username; the regexp then drops names
+    # that merely start with the base, which for short bases is much of the table.
+    result = await db.execute(
+        select(User.username).where(
+            User.username.startswith(base_username, autoescape=True),
+            User.username.regexp_match(f"^{re.escape(base_username)}[0-9]*$")
+        )
+    )
+    # The query follows the column's case-insensitive collation; compare the same way
+    taken = {name.casefold() for name in result.scalars()}
+    username = base_username
+    counter = 1
+    while username.casefold() in taken:
+        username = f"{base_username}{counter}"
+        counter += 1
+    return username
+
+async def find_google_user(
+    db: AsyncSession, google_id: str, email: str, email_verified: bool
+) -> Optional[User]:
+    """Find the account for a Google identity.
+
+    An existing account is matched by email only when Google has verified the
+    address, so an unverified Google account cannot take over a password account.
+    """
+    conditions = [User.google_id == google_id]
+    if email_verified:
+        conditions.append(User.email == email)
+    result = await db.execute(
+        select(User)
+        .where(or_(*conditions))
+        # Prefer the account already linked to this Google id over an email match
+        .order_by((User.google_id == google_id).desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
 @router.post("/register", response_model=UserResponse)
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    logger.info(f"Attempting to register user with email: {user.email} and username: {user.username}")
-    
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if db_user:
-        logger.warning(f"Registration failed: Email {user.email} already registered")
-        raise HTTPException(status_code=400, detail="Email already registered")
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    logger.info("Attempting to register user with email: %s and username: %s", user.email, user.username)
     
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if db_user:
-        logger.warning(f"Registration failed: Username {user.username} already taken")
+    # Check email and username uniqueness in a single round-trip. At most two rows
+    # match (one per unique column); the email conflict is reported first.
+    result = await db.execute(
+        select(User.email, User.username).where(
+            or_(
+                User.email == user.email,
+                User.username == user.username
+            )
+        ).limit(2)
+    )
+    existing = result.all()
+    if existing:
+        # The rows matched under MySQL's case-insensitive collation; compare the same way
+        if any(row.email and row.email.casefold() == user.email.casefold() for row in existing):
+            logger.warning("Registration failed: Email %s already registered", user.email)
+            raise HTTPException(status_code=400, detail="Email already registered")
+        logger.warning("Registration failed: Username %s already taken", user.username)
         raise HTTPException(status_code=400, detail="Username already taken")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     db_user = User(
         email=user.email,
         username=user.username,
         hashed_password=hashed_password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    logger.info(f"Successfully registered user: {user.username}")
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent registration claimed the email or username after our check
+        await db.rollback()
+        logger.warning("Registration failed: Email %s or username %s already in use", user.email, user.username)
+        raise HTTPException(status_code=400, detail="Email or username already registered")
+    await db.refresh(db_user)
+    logger.info("Successfully registered user: %s", user.username)
     return db_user
 
 @router.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    logger.info(f"Login attempt for username/email: {form_data.username}")
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
+    logger.info("Login attempt for username/email: %s", form_data.username)
     
     # Try to find user by username or email
-    user = db.query(User).filter(
-        or_(
-            User.username == form_data.username,
-            User.email == form_data.username
-        )
-    ).first()
+    result = await db.execute(
+        select(User).where(
+            or_(
+                User.username == form_data.username,
+                User.email == form_data.username
+            )
+        ).limit(1)
+    )
+    user = result.scalars().first()
     
     if not user:
-        logger.warning(f"Login failed: User not found for username/email: {form_data.username}")
+        logger.warning("Login failed: User not found for username/email: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username/email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if not verify_password(form_data.password, user.hashed_password):
-        logger.warning(f"Login failed: Invalid password for user: {form_data.username}")
+    if not await verify_password(form_data.password, user.hashed_password):
+        logger.warning("Login failed: Invalid password for user: %s", form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username/email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    access_token_expires = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")))
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data={"sub": str(user.id), "username": user.username}, expires_delta=ACCESS_TOKEN_EXPIRES
     )
-    logger.info(f"Successful login for user: {user.username}")
+    logger.info("Successful login for user: %s", user.username)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
-async def read_users_me(current_user: User = Depends(get_current_user)):
-    response = UserResponse.model_validate(current_user)
-    response.is_oauth_user = bool(current_user.google_id)
-    return response
+async def read_users_me(current_user: User = Depends(get_current_db_user)):
+    return UserResponse.model_validate(current_user).model_copy(
+        update={"is_oauth_user": bool(current_user.google_id)}
+    )
 
 # NextAuth specific endpoints
 @router.post("/nextauth/callback/credentials")
-async def nextauth_callback(request: Request, db: Session = Depends(get_db)):
+async def nextauth_callback(request: Request, db: AsyncSession = Depends(get_db)):
     try:
         data = await request.json()
         email = data.get("email")
@@ -124,16 +331,16 @@ async def nextauth_callback(request: Request, db: Session = Depends(get_db)):
                 detail="Email and password are required"
             )
         
-        user = db.query(User).filter(User.email == email).first()
-        if not user or not verify_password(password, user.hashed_password):
+        result = await db.execute(select(User).where(User.email == email))
+        user = result.scalar_one_or_none()
+        if not user or not await verify_password(password, user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid credentials"
             )
         
-        access_token_expires = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")))
         access_token = create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
+            data={"sub": str(user.id), "username": user.username}, expires_delta=ACCESS_TOKEN_EXPIRES
         )
         
         return {
@@ -142,8 +349,10 @@ async def nextauth_callback(request: Request, db: Session = Depends(get_db)):
             "email": user.email,
             "accessToken": access_token
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"NextAuth callback error: {str(e)}")
+        logger.error("NextAuth callback error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Authentication failed"
@@ -151,44 +360,30 @@ async def nextauth_callback(request: Request, db: Session = Depends(get_db)):
 
 # Google OAuth endpoints for NextAuth
 @router.post("/google/verify")
-async def verify_google_token(auth_request: GoogleAuthRequest, db: Session = Depends(get_db)):
+async def verify_google_token(auth_request: GoogleAuthRequest, db: AsyncSession = Depends(get_db)):
     """Verify Google ID token and return user info."""
     try:
-        # Verify token with Google
-        google_oauth_url = "https://www.googleapis.com/oauth2/v3/tokeninfo"
-        params = {"id_token": auth_request.token}
-        response = requests.get(google_oauth_url, params=params)
-        
-        if response.status_code != 200:
-            logger.error(f"Google token verification failed: {response.text}")
+        # Verify token against Google's signing keys
+        try:
+            token_info = await verify_google_id_token(auth_request.token)
+        except JWTError as e:
+            logger.error("Google token verification failed: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid Google token"
             )
         
-        token_info = response.json()
-        
         # Check if user with this Google ID already exists
         google_id = token_info.get("sub")
         email = token_info.get("email")
+        # Older tokens may carry the claim as a string
+        email_verified = token_info.get("email_verified") in (True, "true")
         
-        user = db.query(User).filter(
-            or_(
-                User.google_id == google_id,
-                User.email == email
-            )
-        ).first()
+        user = await find_google_user(db, google_id, email, email_verified)
         
         if not user:
             # Create new user if not exists
-            username = email.split("@")[0]  # Use part before @ as username
-            base_username = username
-            
-            # Check if username exists, append numbers if needed
-            counter = 1
-            while db.query(User).filter(User.username == username).first():
-                username = f"{base_username}{counter}"
-                counter += 1
+            username = await generate_unique_username(db, email.split("@")[0])  # Use part before @ as username
             
             user = User(
                 email=email,
@@ -200,19 +395,26 @@ async def verify_google_token(auth_request: GoogleAuthRequest, db: Session = Dep
                 preferred_font="sans-serif"
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            try:
+                await db.commit()
+            except IntegrityError:
+                # The email belongs to an account this Google identity may not claim,
+                # or a concurrent signup took the username first
+                await db.rollback()
+                logger.warning("Google signup failed: email %s or username %s already in use", email, username)
+                raise HTTPException(status_code=400, detail="Email or username already registered")
+            await db.refresh(user)
         elif not user.google_id:
             # Update existing email user with Google ID
             user.google_id = google_id
             user.profile_picture = token_info.get("picture")
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
+            await invalidate_cached_user(user)
         
         # Create access token
-        access_token_expires = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")))
         access_token = create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
+            data={"sub": str(user.id), "username": user.username}, expires_delta=ACCESS_TOKEN_EXPIRES
         )
         
         return {
@@ -224,74 +426,26 @@ async def verify_google_token(auth_request: GoogleAuthRequest, db: Session = Dep
             "is_oauth_user": True
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Google authentication error: {str(e)}")
+        logger.error("Google authentication error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Google authentication failed"
         )
 
 @router.post("/nextauth/callback/google")
-async def nextauth_google_callback(request: Request, db: Session = Depends(get_db)):
+async def nextauth_google_callback(payload: NextAuthGooglePayload, db: AsyncSession = Depends(get_db)):
     """Handle NextAuth Google callback."""
     try:
-        # Log the raw request data for debugging
-        request_body = await request.body()
-        logger.info(f"NextAuth Google callback received raw data: {request_body}")
-        
-        data = await request.json()
-        logger.info(f"NextAuth Google callback received parsed data: {data}")
-        
-        # Extract Google profile data sent by NextAuth
-        # Handle different data structures that NextAuth might send
-        if isinstance(data, dict):
-            # Direct data
-            google_id = data.get("id") or data.get("sub")
-            email = data.get("email")
-            name = data.get("name")
-            picture = data.get("picture") or data.get("image")
-        elif hasattr(data, "get"):
-            # If data has a get method
-            google_id = data.get("id") or data.get("sub")
-            email = data.get("email")
-            name = data.get("name")
-            picture = data.get("picture") or data.get("image")
-        else:
-            # Try to access as object properties
-            google_id = getattr(data, "id", None) or getattr(data, "sub", None)
-            email = getattr(data, "email", None)
-            name = getattr(data, "name", None)
-            picture = getattr(data, "picture", None) or getattr(data, "image", None)
+        # The payload model has already merged the user/account/profile shapes NextAuth may send
+        google_id = payload.google_id
+        email = payload.email
+        name = payload.name
+        picture = payload.picture
         
-        # Look for nested objects like data.user or data.account
-        if hasattr(data, "user") and not google_id:
-            user_data = data.user
-            google_id = getattr(user_data, "id", None) or getattr(user_data, "sub", None)
-            email = getattr(user_data, "email", email)
-            name = getattr(user_data, "name", name)
-            picture = getattr(user_data, "picture", picture) or getattr(user_data, "image", picture)
-        
-        if isinstance(data, dict) and "user" in data and not google_id:
-            user_data = data["user"]
-            google_id = user_data.get("id") or user_data.get("sub") or google_id
-            email = user_data.get("email") or email
-            name = user_data.get("name") or name
-            picture = user_data.get("picture") or user_data.get("image") or picture
-        
-        # If we have account data with providerAccountId
-        if isinstance(data, dict) and "account" in data:
-            account_data = data["account"]
-            google_id = account_data.get("providerAccountId") or account_data.get("id") or google_id
-        
-        # For NextAuth specific structure
-        if isinstance(data, dict) and "profile" in data:
-            profile = data["profile"]
-            google_id = profile.get("sub") or profile.get("id") or google_id
-            email = profile.get("email") or email
-            name = profile.get("name") or name
-            picture = profile.get("picture") or profile.get("image") or picture
-        
-        logger.info(f"Extracted Google auth data: id={google_id}, email={email}, name={name}")
+        logger.info("Extracted Google auth data: id=%s, email=%s, name=%s", google_id, email, name)
         
         if not google_id or not email:
             logger.error("Missing required fields: Google ID or email")
@@ -301,24 +455,12 @@ async def nextauth_google_callback(request: Request, db: Session = Depends(get_d
             )
         
         # Check if user exists
-        user = db.query(User).filter(
-            or_(
-                User.google_id == google_id,
-                User.email == email
-            )
-        ).first()
+        user = await find_google_user(db, google_id, email, bool(payload.email_verified))
         
         if not user:
             # Create new user
-            logger.info(f"Creating new user for Google account: {email}")
-            username = email.split("@")[0]  # Use part before @ as username
-            base_username = username
-            
-            # Check if username exists, append numbers if needed
-            counter = 1
-            while db.query(User).filter(User.username == username).first():
-                username = f"{base_username}{counter}"
-                counter += 1
+            logger.info("Creating new user for Google account: %s", email)
+            username = await generate_unique_username(db, email.split("@")[0])  # Use part before @ as username
             
             user = User(
                 email=email,
@@ -330,25 +472,32 @@ async def nextauth_google_callback(request: Request, db: Session = Depends(get_d
                 preferred_font="sans-serif"
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
-            logger.info(f"Created new user with ID: {user.id}, username: {user.username}")
+            try:
+                await db.commit()
+            except IntegrityError:
+                # The email belongs to an account this Google identity may not claim,
+                # or a concurrent signup took the username first
+                await db.rollback()
+                logger.warning("Google signup failed: email %s or username %s already in use", email, username)
+                raise HTTPException(status_code=400, detail="Email or username already registered")
+            await db.refresh(user)
+            logger.info("Created new user with ID: %s, username: %s", user.id, user.username)
         elif not user.google_id:
             # Update existing email user with Google ID
-            logger.info(f"Updating existing user with Google ID: {user.id}, {user.username}")
+            logger.info("Updating existing user with Google ID: %s, %s", user.id, user.username)
             user.google_id = google_id
             user.profile_picture = picture
-            db.commit()
-            db.refresh(user)
+            await db.commit()
+            await db.refresh(user)
+            await invalidate_cached_user(user)
             logger.info("User updated with Google ID")
         else:
-            logger.info(f"User already exists: {user.id}, {user.username}")
+            logger.info("User already exists: %s, %s", user.id, user.username)
         
         # Create access token
         logger.info("Generating access token")
-        access_token_expires = timedelta(minutes=int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")))
         access_token = create_access_token(
-            data={"sub": user.username}, expires_delta=access_token_expires
+            data={"sub": str(user.id), "username": user.username}, expires_delta=ACCESS_TOKEN_EXPIRES
         )
         
         response_data = {
@@ -359,14 +508,14 @@ async def nextauth_google_callback(request: Request, db: Session = Depends(get_d
             "accessToken": access_token,
             "is_oauth_user": True
         }
-        logger.info(f"Successful Google authentication for: {user.username}")
+        logger.info("Successful Google authentication for: %s", user.username)
         return response_data
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"NextAuth Google callback error: {str(e)}")
         # Log the full exception details including traceback
-        import traceback
-        logger.error(f"Full exception details: {traceback.format_exc()}")
+        logger.exception("NextAuth Google callback error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Authentication failed"
@@ -375,36 +524,39 @@ async def nextauth_google_callback(request: Request, db: Session = Depends(get_d
 @router.post("/change-password", status_code=status.HTTP_200_OK)
 async def change_password(
     password_data: PasswordChange,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_db_user),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Change user password. Requires authentication.
     """
-    logger.info(f"Password change attempt for user: {current_user.username}")
+    logger.info("Password change attempt for user: %s", current_user.username)
+    
+    # The password hash is not part of the cached user, so always read it fresh
+    await db.refresh(current_user, ["hashed_password"])
     
     # Handle OAuth users without password
     if not current_user.hashed_password:
-        logger.warning(f"Password change failed: OAuth user without password: {current_user.username}")
+        logger.warning("Password change failed: OAuth user without password: %s", current_user.username)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="OAuth users cannot change their password"
         )
     
     # Verify current password
-    if not verify_password(password_data.current_password, current_user.hashed_password):
-        logger.warning(f"Password change failed: Invalid current password for user: {current_user.username}")
+    if not await verify_password(password_data.current_password, current_user.hashed_password):
+        logger.warning("Password change failed: Invalid current password for user: %s", current_user.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect current password"
         )
     
     # Hash and set new password
-    hashed_password = get_password_hash(password_data.new_password)
+    hashed_password = await get_password_hash(password_data.new_password)
     current_user.hashed_password = hashed_password
     
     # Commit changes to database
-    db.commit()
+    await db.commit()
     
-    logger.info(f"Password successfully changed for user: {current_user.username}")
+    logger.info("Password successfully changed for user: %s", current_user.username)
     return {"message": "Password changed successfully"} 
\ No newline at end of file
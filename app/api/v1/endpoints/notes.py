@@ -1,28 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List, Optional
 import logging
 
+from app.core.etag import etag_matches, make_etag
 from app.db.session import get_db
-from app.models.note import Note, Tag
-from app.models.user import User
-from app.schemas.note import NoteCreate, NoteUpdate, NoteResponse, TagCreate, TagResponse
-from app.api.v1.endpoints.auth import get_current_user
+from app.models.note import Note, Tag, note_tags
+from app.schemas.note import (
+    NOTE_ADAPTER, NOTE_LIST_ADAPTER, NoteCreate, NoteUpdate, NoteResponse, TagCreate, TagResponse
+)
+from app.api.v1.endpoints.auth import AuthPrincipal, get_current_user
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+async def get_user_note(db: AsyncSession, note_id: int, user_id: int) -> Optional[Note]:
+    """Load a note owned by the user, with its tags, or None."""
+    # Tags are loaded up front since lazy loading is not available on an AsyncSession.
+    # populate_existing also makes this a full reload of a note changed by a commit.
+    result = await db.execute(
+        select(Note)
+        .where(Note.id == note_id, Note.user_id == user_id)
+        .options(selectinload(Note.tags))
+        .execution_options(populate_existing=True)
+    )
+    return result.scalar_one_or_none()
+
 @router.post("/", response_model=NoteResponse)
-def create_note(
+async def create_note(
     note: NoteCreate, 
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthPrincipal = Depends(get_current_user)
 ):
     """Create a new note for the current user."""
-    logger.info(f"Creating new note for user: {current_user.username}")
+    logger.info("Creating new note for user: %s", current_user.username)
     
     db_note = Note(
         user_id=current_user.id,
@@ -34,25 +48,24 @@ def create_note(
     )
     
     db.add(db_note)
-    db.commit()
-    db.refresh(db_note)
+    await db.commit()
     
-    logger.info(f"Note created with ID: {db_note.id}")
-    return db_note
+    logger.info("Note created with ID: %s", db_note.id)
+    return await get_user_note(db, db_note.id, current_user.id)
 
 @router.put("/{note_id}", response_model=NoteResponse)
-def update_note(
+async def update_note(
     note_id: int,
     note: NoteUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthPrincipal = Depends(get_current_user)
 ):
     """Update an existing note."""
-    logger.info(f"Updating note ID: {note_id} for user: {current_user.username}")
+    logger.info("Updating note ID: %s for user: %s", note_id, current_user.username)
     
-    db_note = db.query(Note).filter(Note.id == note_id, Note.user_id == current_user.id).first()
+    db_note = await get_user_note(db, note_id, current_user.id)
     if not db_note:
-        logger.warning(f"Note not found or not owned by user: {note_id}")
+        logger.warning("Note not found or not owned by user: %s", note_id)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Note not found or you don't have permission to edit it"
@@ -62,117 +75,144 @@ def update_note(
     for field, value in note.model_dump(exclude_unset=True).items():
         setattr(db_note, field, value)
     
-    db.commit()
-    db.refresh(db_note)
+    await db.commit()
     
-    logger.info(f"Note updated successfully: {note_id}")
-    return db_note
+    logger.info("Note updated successfully: %s", note_id)
+    return await get_user_note(db, note_id, current_user.id)
 
 @router.post("/{note_id}/tags", response_model=NoteResponse)
-def add_tags_to_note(
+async def add_tags_to_note(
     note_id: int,
     tags: List[TagCreate],
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthPrincipal = Depends(get_current_user)
 ):
     """Add tags to a note."""
-    logger.info(f"Adding tags to note ID: {note_id}")
+    logger.info("Adding tags to note ID: %s", note_id)
     
     # Verify note exists and belongs to the current user
-    note = db.query(Note).filter(Note.id == note_id, Note.user_id == current_user.id).first()
+    note = await get_user_note(db, note_id, current_user.id)
     if not note:
-        logger.warning(f"Note not found or not owned by user: {note_id}")
+        logger.warning("Note not found or not owned by user: %s", note_id)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Note not found or you don't have permission to edit it"
         )
     
-    # Process each tag
-    for tag_data in tags:
-        # Check if tag already exists
-        existing_tag = db.query(Tag).filter(Tag.name == tag_data.name).first()
-        
-        if existing_tag:
-            tag = existing_tag
-        else:
-            # Create new tag
-            tag = Tag(name=tag_data.name)
-            db.add(tag)
-            db.commit()
-            db.refresh(tag)
-        
-        # Add tag to note if not already added
-        if tag not in note.tags:
-            note.tags.append(tag)
-    
-    db.commit()
-    db.refresh(note)
-    
-    logger.info(f"Tags added to note ID: {note_id}")
-    return note
+    # Resolve all tag ids in one query. Matching is done on lowercased names
+    # because the lookup follows the column collation (case-insensitive on MySQL).
+    # Sorted so concurrent requests take the unique-key locks below in the same order
+    names = sorted({tag_data.name.lower(): tag_data.name for tag_data in tags}.values(), key=str.lower)
+    result = await db.execute(select(Tag.id, Tag.name).where(Tag.name.in_(names)))
+    tag_ids = {name.lower(): tag_id for tag_id, name in result}
+    
+    missing = [name for name in names if name.lower() not in tag_ids]
+    if missing:
+        # One multi-row insert for the new tags; IGNORE skips any that another
+        # request created since the lookup. MySQL has no RETURNING, so re-select ids.
+        # The re-select must be a locking read: a plain SELECT reads this transaction's
+        # snapshot, which predates tags committed by those concurrent requests. A shared
+        # lock is enough to see them.
+        await db.execute(
+            insert(Tag).prefix_with("IGNORE", dialect="mysql").values([{"name": name} for name in missing])
+        )
+        result = await db.execute(
+            select(Tag.id, Tag.name).where(Tag.name.in_(missing)).with_for_update(read=True)
+        )
+        tag_ids.update({name.lower(): tag_id for tag_id, name in result})
+    
+    # Link only the tags the note doesn't already have, again in a single insert
+    attached = {tag.id for tag in note.tags}
+    links = [
+        {"note_id": note.id, "tag_id": tag_id}
+        for tag_id in sorted(set(tag_ids.values())) if tag_id not in attached
+    ]
+    if links:
+        await db.execute(insert(note_tags).prefix_with("IGNORE", dialect="mysql").values(links))
+    
+    await db.commit()
+    
+    logger.info("Tags added to note ID: %s", note_id)
+    return await get_user_note(db, note_id, current_user.id)
 
 @router.get("/", response_model=List[NoteResponse])
-def get_user_notes(
+async def get_user_notes(
     archived: Optional[bool] = False,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthPrincipal = Depends(get_current_user)
 ):
     """Get all notes for the current user."""
-    logger.info(f"Fetching notes for user: {current_user.username}, archived: {archived}")
+    logger.info("Fetching notes for user: %s, archived: %s", current_user.username, archived)
     
-    notes = db.query(Note).filter(
-        Note.user_id == current_user.id,
-        Note.is_archived == archived
-    ).all()
+    result = await db.execute(
+        select(Note)
+        .where(
+            Note.user_id == current_user.id,
+            Note.is_archived == archived
+        )
+        .order_by(Note.updated_at.desc())
+        .options(selectinload(Note.tags))
+    )
+    notes = result.scalars().all()
     
-    return notes
+    # Serialize directly instead of going through response_model validation and orjson
+    return Response(
+        NOTE_LIST_ADAPTER.dump_json(NOTE_LIST_ADAPTER.validate_python(notes)),
+        media_type="application/json"
+    )
 
 @router.get("/{note_id}", response_model=NoteResponse)
-def get_note(
+async def get_note(
     note_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthPrincipal = Depends(get_current_user)
 ):
     """Get a specific note by ID."""
-    logger.info(f"Fetching note ID: {note_id} for user: {current_user.username}")
+    logger.info("Fetching note ID: %s for user: %s", note_id, current_user.username)
     
-    note = db.query(Note).filter(
-        Note.id == note_id,
-        Note.user_id == current_user.id
-    ).first()
+    note = await get_user_note(db, note_id, current_user.id)
     
     if not note:
-        logger.warning(f"Note not found or not owned by user: {note_id}")
+        logger.warning("Note not found or not owned by user: %s", note_id)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Note not found or you don't have permission to view it"
         )
     
-    return note
+    # Let polling clients revalidate without re-downloading an unchanged note
+    etag = make_etag(
+        note.id, note.title, note.content, note.is_archived, note.theme_color,
+        note.font_family, note.updated_at, [(tag.id, tag.name) for tag in note.tags]
+    )
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return Response(
+        NOTE_ADAPTER.dump_json(NOTE_ADAPTER.validate_python(note)),
+        media_type="application/json",
+        headers={"ETag": etag}
+    )
 
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_note(
+async def delete_note(
     note_id: int,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: AuthPrincipal = Depends(get_current_user)
 ):
     """Delete a note."""
-    logger.info(f"Deleting note ID: {note_id} for user: {current_user.username}")
+    logger.info("Deleting note ID: %s for user: %s", note_id, current_user.username)
     
-    note = db.query(Note).filter(
-        Note.id == note_id,
-        Note.user_id == current_user.id
-    ).first()
+    note = await get_user_note(db, note_id, current_user.id)
     
     if not note:
-        logger.warning(f"Note not found or not owned by user: {note_id}")
+        logger.warning("Note not found or not owned by user: %s", note_id)
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Note not found or you don't have permission to delete it"
         )
     
-    db.delete(note)
-    db.commit()
+    await db.delete(note)
+    await db.commit()
     
-    logger.info(f"Note deleted successfully: {note_id}")
+    logger.info("Note deleted successfully: %s", note_id)
     return 
\ No newline at end of file
@@ -1,43 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
+from app.core.etag import etag_matches, make_etag
 from app.db.session import get_db
 from app.models.user import User
 from app.schemas.user import UserResponse, UserUpdate
-from app.api.v1.endpoints.auth import get_current_user
+from app.api.v1.endpoints.auth import get_current_db_user, invalidate_cached_user
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_db_user)
+):
     """Get current user information."""
-    response = UserResponse.model_validate(current_user)
-    response.is_oauth_user = bool(current_user.google_id)
-    return response
+    # Let polling clients revalidate without re-downloading unchanged user info
+    etag = make_etag(
+        current_user.id, current_user.email, current_user.username, current_user.is_active,
+        current_user.preferred_theme, current_user.preferred_font,
+        current_user.profile_picture, current_user.google_id
+    )
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return UserResponse.model_validate(current_user).model_copy(
+        update={"is_oauth_user": bool(current_user.google_id)}
+    )
 
 @router.put("/me/preferences", response_model=UserResponse)
 async def update_user_preferences(
     preferences: UserUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_db_user)
 ):
     """Update user preferences like theme."""
-    logger.info(f"Updating preferences for user: {current_user.username}")
+    logger.info("Updating preferences for user: %s", current_user.username)
     
     # Update user fields that are provided
     for field, value in preferences.model_dump(exclude_unset=True).items():
         if value is not None:  # Only update if a value is provided
             setattr(current_user, field, value)
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
+    await invalidate_cached_user(current_user)
     
-    logger.info(f"Preferences updated for user: {current_user.username}")
-    response = UserResponse.model_validate(current_user)
-    response.is_oauth_user = bool(current_user.google_id)
-    return response 
\ No newline at end of file
+    logger.info("Preferences updated for user: %s", current_user.username)
+    return UserResponse.model_validate(current_user).model_copy(
+        update={"is_oauth_user": bool(current_user.google_id)}
+    ) 
\ No newline at end of file
@@ -0,0 +1,42 @@
+from typing import Optional
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+import json
+import logging
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Cache shared by every worker process. Caching is disabled when REDIS_URL is not set,
+# and Redis errors are logged and treated as misses so the database stays the fallback.
+redis_client: Optional[Redis] = (
+    Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    if settings.REDIS_URL
+    else None
+)
+
+async def cache_get(key: str) -> Optional[dict]:
+    if redis_client is None:
+        return None
+    try:
+        value = await redis_client.get(key)
+    except RedisError as e:
+        logger.warning("Cache read failed for %s: %s", key, e)
+        return None
+    return json.loads(value) if value is not None else None
+
+async def cache_set(key: str, value: dict, ttl: int) -> None:
+    if redis_client is None:
+        return
+    try:
+        await redis_client.setex(key, ttl, json.dumps(value))
+    except RedisError as e:
+        logger.warning("Cache write failed for %s: %s", key, e)
+
+async def cache_delete(*keys: str) -> None:
+    if redis_client is None:
+        return
+    try:
+        await redis_client.delete(*keys)
+    except RedisError as e:
+        logger.warning("Cache invalidation failed for %s: %s", keys, e)
\ No newline at end of file
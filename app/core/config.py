@@ -0,0 +1,25 @@
+from typing import List, Optional
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+class Settings(BaseSettings):
+    """Application settings, read once from the environment and .env at import."""
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    PROJECT_NAME: str = "Notes App API"
+    VERSION: str = "1.0.0"
+    API_V1_STR: str = "/api/v1"
+    LOG_LEVEL: str = "INFO"
+    # JSON list in the environment, e.g. ALLOWED_ORIGINS='["https://notes.example.com"]'
+    ALLOWED_ORIGINS: List[str] = ["http://localhost:3000"]
+
+    SQLALCHEMY_DATABASE_URL: str
+    REDIS_URL: Optional[str] = None
+
+    SECRET_KEY: str
+    ALGORITHM: str = "HS256"
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+
+    # Required by /auth/google/verify, which rejects every token while it is unset
+    GOOGLE_CLIENT_ID: Optional[str] = None
+
+settings = Settings()
\ No newline at end of file
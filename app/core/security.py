@@ -1,20 +1,70 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
 from jose import jwt
 from passlib.context import CryptContext
+from cachetools import TTLCache
+import asyncio
+import hashlib
+import multiprocessing
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from app.core.config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+# bcrypt is deliberately CPU-heavy, so hashing runs in worker processes on all cores
+# instead of stalling the event loop. Workers are spawned on first use and shut down
+# in the app lifespan.
+crypto_pool = ProcessPoolExecutor(
+    max_workers=os.cpu_count(),
+    mp_context=multiprocessing.get_context("spawn")
+)
+
+# Short-lived memo of successful bcrypt checks so a client re-submitting the same
+# credentials in a burst pays the hashing cost once. Failures are never cached, so
+# every wrong guess still costs a full bcrypt round.
+_verified_passwords = TTLCache(maxsize=1024, ttl=5)
+
+# Checks currently running in the pool, so identical concurrent requests share one bcrypt run
+_pending_verifications: Dict[bytes, asyncio.Future] = {}
+
+def _verify_hash(plain_password: str, hashed_password: Optional[str]) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
+def _hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def verify_password(plain_password: str, hashed_password: Optional[str]) -> bool:
+    key = None
+    if hashed_password:
+        key = hashlib.blake2b(
+            plain_password.encode() + b"\0" + hashed_password.encode(), digest_size=16
+        ).digest()
+        if key in _verified_passwords:
+            return True
+        pending = _pending_verifications.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(crypto_pool, _verify_hash, plain_password, hashed_password)
+    if key is None:
+        return await future
+
+    _pending_verifications[key] = future
+    try:
+        # Shielded so a cancelled request does not cancel the check for the others waiting on it
+        verified = await asyncio.shield(future)
+    finally:
+        _pending_verifications.pop(key, None)
+    if verified:
+        _verified_passwords[key] = True
+    return verified
+
+async def get_password_hash(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(crypto_pool, _hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -22,5 +72,5 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, os.getenv("SECRET_KEY"), algorithm=os.getenv("ALGORITHM", "HS256"))
+    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt 
\ No newline at end of file
@@ -0,0 +1,5 @@
+from sqlalchemy.orm import DeclarativeBase
+
+class Base(DeclarativeBase):
+    """Shared declarative base; every model module imports it from here."""
+    pass
\ No newline at end of file
@@ -0,0 +1,7 @@
+from app.db.session import engine
+from app.models import Base
+
+async def init_db() -> None:
+    """Create any missing tables. Run once at startup rather than on model import."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
@@ -1,29 +1,64 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-import os
-from dotenv import load_dotenv
+import logging.config
 from app.api.v1.endpoints import auth
 from app.api.v1.endpoints import notes
 from app.api.v1.endpoints import users
+from app.core.cache import redis_client
+from app.core.config import settings
+from app.core.security import crypto_pool
+from app.db.init_db import init_db
+from app.db.session import engine
 
-load_dotenv()
+# Configure logging once for the whole app; modules only create named loggers
+logging.config.dictConfig({
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "default": {"format": "%(levelname)s:%(name)s:%(message)s"}
+    },
+    "handlers": {
+        "default": {"class": "logging.StreamHandler", "formatter": "default"}
+    },
+    "root": {"level": settings.LOG_LEVEL, "handlers": ["default"]},
+})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    # Build the OpenAPI document now; FastAPI caches it, so the first /docs load
+    # doesn't pay for generating JSON schemas from every model
+    app.openapi()
+    yield
+    await auth.google_client.aclose()
+    if redis_client is not None:
+        await redis_client.aclose()
+    await engine.dispose()
+    crypto_pool.shutdown()
 
 app = FastAPI(
-    title=os.getenv("PROJECT_NAME", "Notes App API"),
-    version=os.getenv("VERSION", "1.0.0"),
-    openapi_url=f"{os.getenv('API_V1_STR', '/api/v1')}/openapi.json"
+    title=settings.PROJECT_NAME,
+    version=settings.VERSION,
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
+    # orjson encodes large note lists considerably faster than the stdlib json module
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Allows all origins
+    allow_origins=settings.ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],  # Allows all methods
-    allow_headers=["*"],  # Allows all headers
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match"],
+    expose_headers=["ETag"],
+    max_age=86400,  # Let browsers cache preflight responses for a day
 )
 
 # Include routers
-app.include_router(auth.router, prefix=f"{os.getenv('API_V1_STR', '/api/v1')}/auth", tags=["auth"]) 
-app.include_router(notes.router, prefix=f"{os.getenv('API_V1_STR', '/api/v1')}/notes", tags=["notes"]) 
-app.include_router(users.router, prefix=f"{os.getenv('API_V1_STR', '/api/v1')}/users", tags=["users"]) 
\ No newline at end of file
+app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["auth"]) 
+app.include_router(notes.router, prefix=f"{settings.API_V1_STR}/notes", tags=["notes"]) 
+app.include_router(users.router, prefix=f"{settings.API_V1_STR}/users", tags=["users"]) 
\ No newline at end of file
@@ -1,4 +1,5 @@
-from app.models.user import User, Base
+from app.db.base_class import Base
+from app.models.user import User
 from app.models.note import Note, Tag, note_tags
 
 # All models should be imported here for easy access
@@ -1,38 +1,53 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, ForeignKey, Table
-from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+from typing import TYPE_CHECKING, List, Optional
+from sqlalchemy import Boolean, Column, Integer, String, Text, DateTime, ForeignKey, Table, Index, FetchedValue, text
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
-from app.db.session import engine
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from app.models.user import Base, User
+from app.db.base_class import Base
+
+if TYPE_CHECKING:
+    from app.models.user import User
 
 class Note(Base):
     __tablename__ = "notes"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    title = Column(String(255))
-    content = Column(Text)
-    is_archived = Column(Boolean, default=False)
-    theme_color = Column(String(20))
-    font_family = Column(String(50))
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
-
-    # Relationship with user
-    user = relationship("User", back_populates="notes")
-    # Relationship with tags through note_tags
-    tags = relationship("Tag", secondary="note_tags", back_populates="notes")
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    title: Mapped[Optional[str]] = mapped_column(String(255))
+    content: Mapped[Optional[str]] = mapped_column(Text)
+    is_archived: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
+    theme_color: Mapped[Optional[str]] = mapped_column(String(20))
+    font_family: Mapped[Optional[str]] = mapped_column(String(50))
+    # Timestamps are maintained by MySQL, so inserts and updates don't send them at all
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        server_default=text("CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+        server_onupdate=FetchedValue(),
+        nullable=False,
+    )
+
+    # Relationship with user; raises instead of lazy loading
+    user: Mapped["User"] = relationship(back_populates="notes", lazy="raise")
+    # Relationship with tags through note_tags, batch-loaded with one IN query per result set
+    tags: Mapped[List["Tag"]] = relationship(secondary="note_tags", back_populates="notes", lazy="selectin")
+
+    __table_args__ = (
+        # Serves the per-user note list filtered by archive state, newest first, without a sort
+        Index("ix_notes_user_archived_updated", "user_id", "is_archived", text("updated_at DESC")),
+    )
 
 
 class Tag(Base):
     __tablename__ = "tags"
 
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    name = Column(String(50), unique=True, nullable=False)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
 
-    # Relationship with notes through note_tags
-    notes = relationship("Note", secondary="note_tags", back_populates="tags")
+    # Relationship with notes through note_tags; never loaded implicitly, since a tag
+    # can span every user's notes
+    notes: Mapped[List["Note"]] = relationship(secondary="note_tags", back_populates="tags", lazy="raise")
 
 
 # Association table for many-to-many relationship between notes and tags
@@ -41,7 +56,6 @@ note_tags = Table(
     Base.metadata,
     Column("note_id", Integer, ForeignKey("notes.id", ondelete="CASCADE"), primary_key=True),
     Column("tag_id", Integer, ForeignKey("tags.id", ondelete="CASCADE"), primary_key=True),
-)
-
-# Create tables
-Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    # The primary key only serves lookups by note_id; this covers "notes for a tag"
+    Index("ix_note_tags_tag_id", "tag_id", "note_id"),
+)
\ No newline at end of file
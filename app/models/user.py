@@ -1,29 +1,31 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text
-from app.db.session import engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from typing import TYPE_CHECKING, List, Optional
+from sqlalchemy import Boolean, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-Base = declarative_base()
+from app.db.base_class import Base
+
+if TYPE_CHECKING:
+    from app.models.note import Note
 
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
-    email = Column(String(255), unique=True, index=True)
-    username = Column(String(100), unique=True, index=True)
-    hashed_password = Column(String(255), nullable=True)  # Nullable for OAuth users
-    is_active = Column(Boolean, default=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    email: Mapped[Optional[str]] = mapped_column(String(255), unique=True, index=True)
+    username: Mapped[Optional[str]] = mapped_column(String(100), unique=True, index=True)
+    hashed_password: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)  # Nullable for OAuth users
+    is_active: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
     
     # User preferences
-    preferred_theme = Column(String(50), nullable=True, default="light")
-    preferred_font = Column(String(50), nullable=True, default="sans-serif")
+    preferred_theme: Mapped[Optional[str]] = mapped_column(String(50), nullable=True, default="light")
+    preferred_font: Mapped[Optional[str]] = mapped_column(String(50), nullable=True, default="sans-serif")
     
     # OAuth related fields
-    google_id = Column(String(255), unique=True, nullable=True, index=True)
-    profile_picture = Column(String(512), nullable=True)
+    google_id: Mapped[Optional[str]] = mapped_column(String(255), unique=True, nullable=True, index=True)
+    profile_picture: Mapped[Optional[str]] = mapped_column(String(512), nullable=True)
     
-    # Relationship with notes
-    notes = relationship("Note", back_populates="user", cascade="all, delete-orphan")
-
-# Create tables
-Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+    # Relationship with notes; raises instead of lazy loading. Deleting a user leaves the
+    # notes to the ON DELETE CASCADE foreign key instead of loading them first.
+    notes: Mapped[List["Note"]] = relationship(
+        back_populates="user", cascade="all, delete-orphan", lazy="raise", passive_deletes=True
+    )
\ No newline at end of file
@@ -1,43 +1,55 @@
-from pydantic import BaseModel
-from typing import Optional, List, Any
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field, StringConstraints, TypeAdapter
+from typing import Annotated
 from datetime import datetime
 
 # Tag schemas
 class TagBase(BaseModel):
-    name: str
+    name: str = Field(max_length=50)
 
 class TagCreate(TagBase):
-    pass
+    # Normalized on input so "Work", " work" and "work" all resolve to one tag
+    name: Annotated[str, StringConstraints(strip_whitespace=True, to_lower=True, min_length=1, max_length=50)]
 
 class TagResponse(TagBase):
     id: int
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="forbid", frozen=True)
 
 # Note schemas
+def _fits_text_column(content: str | None) -> str | None:
+    # TEXT holds 65535 bytes, not characters; multi-byte text hits that limit sooner
+    if content is not None and len(content.encode("utf-8")) > 65535:
+        raise ValueError("content must be at most 65535 bytes when UTF-8 encoded")
+    return content
+
+# Input-only, so stored notes are never re-checked when they are read back
+NoteContent = Annotated[str | None, Field(max_length=65535), AfterValidator(_fits_text_column)]
+
 class NoteBase(BaseModel):
-    title: Optional[str] = None
-    content: Optional[str] = None
-    is_archived: Optional[bool] = False
-    theme_color: Optional[str] = None
-    font_family: Optional[str] = None
+    title: str | None = Field(default=None, max_length=255)
+    content: str | None = Field(default=None, max_length=65535)
+    is_archived: bool | None = False
+    theme_color: str | None = Field(default=None, max_length=20)
+    font_family: str | None = Field(default=None, max_length=50)
 
 class NoteCreate(NoteBase):
-    pass
+    content: NoteContent = None
 
 class NoteUpdate(NoteBase):
-    pass
+    content: NoteContent = None
 
 class NoteResponse(NoteBase):
     id: int
     user_id: int
     created_at: datetime
     updated_at: datetime
-    tags: List[TagResponse] = []
+    tags: list[TagResponse] = Field(default_factory=list)
+
+    model_config = ConfigDict(from_attributes=True, extra="forbid", frozen=True)
 
-    class Config:
-        from_attributes = True
+# Built once at import; handlers use them to go from ORM objects straight to JSON bytes
+NOTE_ADAPTER = TypeAdapter(NoteResponse)
+NOTE_LIST_ADAPTER = TypeAdapter(list[NoteResponse])
 
 # For adding tags to notes
 class NoteTagLink(BaseModel):
@@ -1,30 +1,32 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, EmailStr, Field, model_validator
+from typing import Any, ClassVar
 
 class UserBase(BaseModel):
-    email: str
-    username: str
-    preferred_theme: Optional[str] = "light"
-    preferred_font: Optional[str] = "sans-serif"
+    email: str = Field(max_length=255)
+    username: str = Field(max_length=100)
+    preferred_theme: str | None = Field(default="light", max_length=50)
+    preferred_font: str | None = Field(default="sans-serif", max_length=50)
 
 class UserCreate(UserBase):
+    # Only checked on input; responses keep the looser base types so existing rows
+    # (which were never validated this way) always serialize
+    email: EmailStr
+    username: str = Field(min_length=1, max_length=100)
     password: str
 
 class UserResponse(UserBase):
     id: int
     is_active: bool
-    profile_picture: Optional[str] = None
+    profile_picture: str | None = None
     is_oauth_user: bool = False
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True, extra="forbid", frozen=True)
 
 class UserUpdate(BaseModel):
-    preferred_theme: Optional[str] = None
-    preferred_font: Optional[str] = None
+    preferred_theme: str | None = Field(default=None, max_length=50)
+    preferred_font: str | None = Field(default=None, max_length=50)
 
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class PasswordChange(BaseModel):
     current_password: str
@@ -35,16 +37,89 @@ class Token(BaseModel):
     token_type: str
 
 class TokenData(BaseModel):
-    username: Optional[str] = None
+    user_id: int | None = None
+    username: str | None = None
 
 # Google OAuth related schemas
 class GoogleAuthRequest(BaseModel):
     token: str
 
+# NextAuth Google callback payloads. Profile fields may arrive at the top level or
+# nested under user/account/profile depending on the NextAuth callback that sends them.
+def _first_present(data: dict, *keys: str) -> Any:
+    """Return the first non-empty value among keys, skipping null and "" like `a or b`."""
+    for key in keys:
+        if data.get(key):
+            return data[key]
+    return None
+
+class NextAuthGoogleUser(BaseModel):
+    # Keys to read the Google id from, in order of preference
+    GOOGLE_ID_KEYS: ClassVar[tuple[str, ...]] = ("id", "sub")
+
+    google_id: str | None = None
+    email: str | None = None
+    # Google's claim that the address belongs to this account; emails are only
+    # matched to existing users when it is set
+    email_verified: bool | None = None
+    name: str | None = None
+    picture: str | None = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def pick_aliases(cls, data: Any) -> Any:
+        if isinstance(data, dict):
+            google_id = _first_present(data, *cls.GOOGLE_ID_KEYS)
+            data = {
+                **data,
+                # Ids are strings in the database; some providers send them as numbers
+                "google_id": str(google_id) if google_id is not None else None,
+                "picture": _first_present(data, "picture", "image"),
+            }
+        return data
+
+class NextAuthGoogleProfile(NextAuthGoogleUser):
+    GOOGLE_ID_KEYS: ClassVar[tuple[str, ...]] = ("sub", "id")
+
+class NextAuthGoogleAccount(BaseModel):
+    provider_account_id: str | None = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def pick_aliases(cls, data: Any) -> Any:
+        if isinstance(data, dict):
+            account_id = _first_present(data, "providerAccountId", "id")
+            data = {**data, "provider_account_id": str(account_id) if account_id is not None else None}
+        return data
+
+class NextAuthGooglePayload(NextAuthGoogleUser):
+    user: NextAuthGoogleUser | None = None
+    account: NextAuthGoogleAccount | None = None
+    profile: NextAuthGoogleProfile | None = None
+
+    @model_validator(mode="after")
+    def merge_nested(self) -> "NextAuthGooglePayload":
+        # user only fills in when the top level has no id; account and profile take precedence
+        if self.user is not None and not self.google_id:
+            self.google_id = self.user.google_id
+            self.email = self.user.email or self.email
+            self.email_verified = self.user.email_verified or self.email_verified
+            self.name = self.user.name or self.name
+            self.picture = self.user.picture or self.picture
+        if self.account is not None:
+            self.google_id = self.account.provider_account_id or self.google_id
+        if self.profile is not None:
+            self.google_id = self.profile.google_id or self.google_id
+            self.email = self.profile.email or self.email
+            self.email_verified = self.profile.email_verified or self.email_verified
+            self.name = self.profile.name or self.name
+            self.picture = self.profile.picture or self.picture
+        return self
+
 class OAuthUserCreate(BaseModel):
-    email: str
-    username: str
-    google_id: str
-    profile_picture: Optional[str] = None
-    preferred_theme: Optional[str] = "light"
-    preferred_font: Optional[str] = "sans-serif" 
\ No newline at end of file
+    email: EmailStr
+    username: str = Field(min_length=1, max_length=100)
+    google_id: str = Field(max_length=255)
+    profile_picture: str | None = Field(default=None, max_length=512)
+    preferred_theme: str | None = Field(default="light", max_length=50)
+    preferred_font: str | None = Field(default="sans-serif", max_length=50) 
\ No newline at end of file